@@ -21,10 +21,35 @@
 # SOFTWARE.
 
 import json
+import re
+
 from perceval import Experiment, PayloadGenerator
 from perceval.serialization import serialize, deserialize
 from qat.core import HardwareSpecs, Job as MyQLMJob, Result as MyQLMResult
 
+# Encoding always uses the json module: orjson would write NaN and infinities as null, and fails on large integers
+_json_dumps = json.dumps
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+# orjson turns integers exceeding 64 bits into floats, so texts that may contain such integers are left to json
+_MAYBE_LARGE_INT = re.compile(r"\d{19}")
+
+
+def _orjson_loads(raw: str):
+    if _MAYBE_LARGE_INT.search(raw) is None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:  # NaN and infinities, written by json but rejected by orjson
+            pass
+    return json.loads(raw)
+
+
+_json_loads = _orjson_loads if orjson is not None else json.loads
+
 
 class MyQLMHelper:
     """
@@ -80,6 +105,8 @@ class MyQLMHelper:
         :return: A MyQLM Job instance containing the perceval payload as a string in the meta_data field.
         """
         payload = PayloadGenerator.generate_payload(command, experiment, params, platform_name, **kwargs)
+        # Only the experiment is serialized by the generator, params and kwargs may still hold perceval objects.
+        # Serializing the already serialized experiment is cheap, as it is kept as is.
         return MyQLMHelper.make_job_from_payload(payload)
 
     @staticmethod
@@ -88,17 +115,52 @@ class MyQLMHelper:
         MyQLMHelper.write_meta_data(job, MyQLMHelper.PAYLOAD_KEY, payload)
         return job
 
+    @staticmethod
+    def dumps(value) -> str:
+        """
+        :param value: Any value that can be serialized by perceval
+        :return: The JSON string representing the value, as stored in a meta_data field
+        """
+        return _json_dumps(serialize(value))
+
+    @staticmethod
+    def loads(raw: str, deserialize_value: bool = True):
+        """
+        :param raw: A JSON string, as stored in a meta_data field
+        :param deserialize_value: If False, the value is only decoded from JSON and stays in its serialized form,
+                                  which is enough to forward it to a Quandela platform
+        :return: The value represented by the JSON string
+        """
+        value = _json_loads(raw)
+        return deserialize(value) if deserialize_value else value
+
     @staticmethod
     def parse_meta_data(obj, key: str):
-        if not hasattr(obj, "meta_data") or obj.meta_data is None:
+        meta_data = getattr(obj, "meta_data", None)
+        if meta_data is None:
             return None
-        return deserialize(json.loads(obj.meta_data[key]))
+        return MyQLMHelper.loads(meta_data[key])
 
     @staticmethod
     def write_meta_data(obj, key: str, value):
-        if not hasattr(obj, "meta_data") or not obj.meta_data:
+        if not obj.meta_data:
+            obj.meta_data = {}
+        obj.meta_data[key] = MyQLMHelper.dumps(value)
+
+    @staticmethod
+    def read_meta_data_raw(obj, key: str):
+        # Same as parse_meta_data, but returns the JSON string as stored
+        meta_data = getattr(obj, "meta_data", None)
+        if meta_data is None:
+            return None
+        return meta_data[key]
+
+    @staticmethod
+    def write_meta_data_raw(obj, key: str, raw: str):
+        # Same as write_meta_data, for a value that is already serialized as a JSON string
+        if not obj.meta_data:
             obj.meta_data = {}
-        obj.meta_data[key] = json.dumps(serialize(value))
+        obj.meta_data[key] = raw
 
     @staticmethod
     def retrieve_results(results: MyQLMResult) -> dict:
@@ -19,15 +19,20 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import asyncio
+import threading
+import time
+import weakref
+
 from qat.core import HardwareSpecs, Job as MyQLMJob, Result as MyQLMResult
 from qat.core.qpu import QPUHandler
 
 from perceval import RemoteJob, RemoteProcessor, PayloadGenerator, ProcessorType
+from perceval.runtime.job_status import RunningStatus
 from perceval.runtime.remote_processor import PERFS_KEY
 from perceval.utils.logging import channel, get_logger
 from requests import HTTPError
 
-from .myqlm_converter import MyQLMConverter
 from .myqlm_helper import MyQLMHelper
 
 
@@ -38,6 +43,8 @@ class QuandelaQPUHandler(QPUHandler):
 
     :param remote_processor: A constructed Perceval access to a remote platform which will be used to send requests and
                              retrieve results.
+    :param max_concurrent_jobs: Maximum number of jobs submitted through :meth:`submit_job_async` from the same event
+                                loop that can run at the same time on the platform. Defaults to 10.
 
     This class can be used in two ways:
 
@@ -79,11 +86,29 @@ class QuandelaQPUHandler(QPUHandler):
     >>> result = qpu.submit_job(myqlm_job)
     """
 
-    def __init__(self, remote_processor: RemoteProcessor):
+    _REFRESH_DELAY = 3  # Delay (in s) between two job status requests
+
+    def __init__(self, remote_processor: RemoteProcessor, max_concurrent_jobs: int = 10):
         super().__init__()
         self.processor = remote_processor  # Used to get the specs
         self.handler = remote_processor.get_rpc_handler()  # Used to submit jobs
-        self._job = None
+        self._jobs: dict[str, RemoteJob] = {}  # Jobs currently running on the platform, by job id
+        self._max_concurrent_jobs = max_concurrent_jobs
+        self._fanouts = weakref.WeakKeyDictionary()  # Semaphores limiting the async jobs, one per event loop
+        self._converter = None  # Built on first gate-based circuit, then reused (each conversion starts afresh)
+        self._converter_lock = threading.Lock()  # The converter holds the state of the conversion in progress
+        self._platform_details_cache = (0., None)  # (monotonic timestamp, platform details)
+
+        # These fields are not supposed to change, so they are serialized once and for all
+        self._specs_json = MyQLMHelper.dumps(remote_processor.specs)
+        self._type_json = MyQLMHelper.dumps(remote_processor.type.name)
+
+    def _get_platform_details(self, ttl: float = 1.) -> dict:
+        timestamp, platform_details = self._platform_details_cache
+        if platform_details is None or time.monotonic() - timestamp >= ttl:
+            platform_details = self.handler.fetch_platform_details()
+            self._platform_details_cache = (time.monotonic(), platform_details)
+        return platform_details
 
     def get_specs(self) -> HardwareSpecs:
         """
@@ -106,15 +131,13 @@ class QuandelaQPUHandler(QPUHandler):
         * Current job progress (float between 0 and 1, 1 meaning 100% or no job running)
         """
         hw = HardwareSpecs()
-
-        # These fields are not supposed to change
-        MyQLMHelper.write_meta_data(hw, MyQLMHelper.SPECS_KEY, self.processor.specs)
-        MyQLMHelper.write_meta_data(hw, MyQLMHelper.TYPE_KEY, self.processor.type.name)
+        MyQLMHelper.write_meta_data_raw(hw, MyQLMHelper.SPECS_KEY, self._specs_json)
+        MyQLMHelper.write_meta_data_raw(hw, MyQLMHelper.TYPE_KEY, self._type_json)
 
         MyQLMHelper.write_meta_data(hw, MyQLMHelper.PROGRESS_KEY, self._get_progress())
 
         try:
-            platform_details = self.handler.fetch_platform_details()
+            platform_details = self._get_platform_details()
         except HTTPError:
             platform_details = {}
 
@@ -130,8 +153,9 @@ class QuandelaQPUHandler(QPUHandler):
             MyQLMHelper.write_meta_data(hw, MyQLMHelper.WAITING_JOB_KEY, platform_details["waiting_jobs"])
         return hw
 
-    def _get_progress(self):
-        return self._job.status.progress if self._job is not None else 1.
+    def _get_progress(self) -> float:
+        # The least advanced job gives the progress, so that 1 is only reached when all jobs are complete
+        return min((remote_job.status.progress for remote_job in list(self._jobs.values())), default=1.)
 
     def submit_job(self, job: MyQLMJob) -> MyQLMResult:
         """
@@ -144,17 +168,88 @@ class QuandelaQPUHandler(QPUHandler):
 
         :return: A myQLM ``Result`` containing Perceval-like results in its metadata field
         """
+        return self._run([self._make_payload(job)])[0]
+
+    def submit_batch(self, jobs: list[MyQLMJob]) -> list[MyQLMResult]:
+        """
+        Submit several myQLM jobs to the Quandela platform at once.
+
+        All the jobs are sent to the platform before waiting for any result, so that they are queued together and the
+        platform availability is only checked once.
+
+        :param jobs: A list of myQLM ``Job``, each of them being valid for :meth:`submit_job`
+        :return: A list of myQLM ``Result``, in the same order as the jobs
+        """
+        return self._run([self._make_payload(job) for job in jobs])
+
+    async def submit_job_async(self, job: MyQLMJob) -> MyQLMResult:
+        """
+        Submit a myQLM job to the Quandela platform without blocking the event loop, so that several jobs can be
+        awaited concurrently:
+
+        >>> results = await asyncio.gather(*(handler.submit_job_async(job) for job in jobs))
+
+        At most ``max_concurrent_jobs`` jobs run at the same time, the other ones wait for a slot before being sent.
+
+        :param job: A myQLM ``Job``, valid for :meth:`submit_job`
+        :return: A myQLM ``Result`` containing Perceval-like results in its metadata field
+        """
+        full_payload = await asyncio.to_thread(self._make_payload, job)
+
+        # asyncio semaphores can only be used from the event loop they were first used in
+        loop = asyncio.get_running_loop()
+        fanout = self._fanouts.get(loop)
+        if fanout is None:
+            fanout = self._fanouts[loop] = asyncio.Semaphore(self._max_concurrent_jobs)
+
+        async with fanout:
+            await asyncio.to_thread(self._check_platform_availability)
+
+            # The thread creating the job can't be interrupted: if this task is cancelled meanwhile, the job is aborted
+            # as soon as it has been created
+            starting = asyncio.ensure_future(asyncio.to_thread(self._start_job, full_payload))
+            try:
+                remote_job, job_context = await asyncio.shield(starting)
+            except asyncio.CancelledError:
+                starting.add_done_callback(self._abort_started_job)
+                raise
+
+            try:
+                while not await asyncio.to_thread(lambda: remote_job.is_complete):
+                    await asyncio.sleep(self._REFRESH_DELAY)
+                return await asyncio.to_thread(self._make_result, remote_job, job_context)
+            except BaseException:
+                await asyncio.to_thread(self._cancel_jobs, [remote_job])
+                raise
+            finally:
+                self._end_job(remote_job)
+
+    def _abort_started_job(self, starting: asyncio.Future):
+        if starting.cancelled() or starting.exception() is not None:
+            return
+        remote_job, _ = starting.result()
+        starting.get_loop().run_in_executor(None, self._abort_job, remote_job)
+
+    def _abort_job(self, remote_job: RemoteJob):
+        self._cancel_jobs([remote_job])
+        self._end_job(remote_job)
 
+    def _make_payload(self, job: MyQLMJob) -> dict:
+        # The payload is kept in its serialized form, as it is only forwarded to the remote platform
         if job.circuit is not None and job.nbshots:
-            converter = MyQLMConverter()
-            p = converter.convert(job.circuit, use_postselection=True)
+            with self._converter_lock:
+                if self._converter is None:
+                    from .myqlm_converter import MyQLMConverter
+                    self._converter = MyQLMConverter()
+                experiment = self._converter.convert(job.circuit, use_postselection=True).experiment
             full_payload = PayloadGenerator.generate_payload(command="sample_count",
-                                                             experiment=p.experiment,
+                                                             experiment=experiment,
                                                              platform_name=self.handler.name,
                                                              max_shots=job.nbshots,
                                                              max_samples=job.nbshots)
         else:
-            full_payload = MyQLMHelper.parse_meta_data(job, MyQLMHelper.PAYLOAD_KEY)
+            raw_payload = MyQLMHelper.read_meta_data_raw(job, MyQLMHelper.PAYLOAD_KEY)
+            full_payload = MyQLMHelper.loads(raw_payload, deserialize_value=False) if raw_payload is not None else None
 
         if full_payload is None:
             raise RuntimeError("No valid payload data found")
@@ -165,35 +260,93 @@ class QuandelaQPUHandler(QPUHandler):
         elif full_payload['platform_name'] != self.processor.name:
             raise RuntimeError("Platform name mismatch")
 
+        return full_payload
+
+    def _check_platform_availability(self):
         try:
-            platform_details = self.handler.fetch_platform_details()
+            platform_details = self._get_platform_details()
         except HTTPError:
             raise RuntimeError("Platform is not available")
         if platform_details.get("status") != 'available':
             raise RuntimeError("Platform is not available")
 
-        job_name = full_payload['payload'].get("job_name", full_payload['payload'].get("command", "Job"))
-        job_context = full_payload['payload'].get('job_context')
+    def _start_job(self, full_payload: dict) -> tuple[RemoteJob, dict]:
+        payload = full_payload['payload']
+        job_name = payload["job_name"] if "job_name" in payload else payload.get("command", "Job")
+        job_context = payload.get('job_context')
 
-        if self._job is not None:
-            raise RuntimeError("A job is already running")
-
-        self._job = RemoteJob(full_payload, self.handler, job_name)
+        remote_job = RemoteJob(full_payload, self.handler, job_name)
         try:
-            pcvl_results = self._job.execute_sync()
+            remote_job.execute_async()
         except Exception:
-            if self._job.status.failed:
-                get_logger().warn(f'The job failed: {self._job.status.stop_message}', channel.user)
-                pcvl_results = {'error': self._job.status.stop_message}
-            else:
+            if not remote_job.status.failed:
                 raise
+        if remote_job.id is not None:
+            self._jobs[remote_job.id] = remote_job
+        return remote_job, job_context
+
+    def _end_job(self, remote_job: RemoteJob):
+        self._jobs.pop(remote_job.id, None)
+        self._platform_details_cache = (0., None)  # The platform status may have changed with the job completion
+
+    @staticmethod
+    def _cancel_jobs(remote_jobs: list[RemoteJob]):
+        # Jobs left running on the platform would be billed while nobody waits for their results anymore
+        for remote_job in remote_jobs:
+            try:
+                if remote_job.id is not None and not remote_job.is_complete:
+                    remote_job.cancel()
+            except Exception as e:
+                get_logger().warn(f'Could not cancel job {remote_job.id}: {e}', channel.user)
+
+    def _run(self, full_payloads: list[dict]) -> list[MyQLMResult]:
+        self._check_platform_availability()
+
+        started_jobs = []
+        try:
+            for full_payload in full_payloads:
+                started_jobs.append(self._start_job(full_payload))
 
-        if job_context is not None:
-            pcvl_results["job_context"] = job_context
+            while not all(remote_job.is_complete for remote_job, _ in started_jobs):
+                time.sleep(self._REFRESH_DELAY)
+
+            return [self._make_result(remote_job, job_context) for remote_job, job_context in started_jobs]
 
-        self._job = None
+        except BaseException:
+            self._cancel_jobs([remote_job for remote_job, _ in started_jobs])
+            raise
 
+        finally:
+            for remote_job, _ in started_jobs:
+                self._end_job(remote_job)
+
+    def _make_result(self, remote_job: RemoteJob, job_context) -> MyQLMResult:
         result = MyQLMResult()
-        # Note: we could avoid a deserialization/serialization
+        job_status = remote_job.status
+
+        # A cancelled job may still have partial results, only a job in error is known to have none
+        if job_status.status != RunningStatus.ERROR:
+            if job_status.status == RunningStatus.CANCELED:
+                get_logger().warn("Trying to get partial results from a cancelled job", channel.user)
+            try:
+                raw_results = self.handler.get_job_results(remote_job.id).get('results')
+                if raw_results is None:
+                    raise RuntimeError('Results are not available')
+            except Exception:
+                if not job_status.failed:
+                    raise
+            else:
+                # Results are forwarded as received, without being deserialized
+                if job_context is not None:
+                    pcvl_results = MyQLMHelper.loads(raw_results, deserialize_value=False)
+                    pcvl_results["job_context"] = job_context
+                    raw_results = MyQLMHelper.dumps(pcvl_results)
+                MyQLMHelper.write_meta_data_raw(result, MyQLMHelper.RESULTS_KEY, raw_results)
+                return result
+
+        get_logger().warn(f'The job failed: {job_status.stop_message}', channel.user)
+        pcvl_results = {'error': job_status.stop_message}
+        if job_context is not None:
+            pcvl_results["job_context"] = job_context
         MyQLMHelper.write_meta_data(result, MyQLMHelper.RESULTS_KEY, pcvl_results)
         return result
@@ -19,12 +19,14 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import asyncio
 import json
+import math
 import os
 
 import pytest
-from perceval import RemoteProcessor, Experiment, Matrix, Unitary, BasicState, PayloadGenerator, NoiseModel, \
-    BSDistribution, FockState, ProviderFactory, BSSamples
+from perceval import RemoteJob, RemoteProcessor, Experiment, Matrix, Unitary, BasicState, PayloadGenerator, \
+    NoiseModel, BSDistribution, FockState, ProviderFactory, BSSamples
 from perceval.algorithm import Sampler
 from perceval.runtime.rpc_handler import RPCHandler
 from perceval.serialization import serialize
@@ -37,42 +39,58 @@ except ModuleNotFoundError as e:
     assert e.name == "qat"
     pytest.skip("need `myqlm` module", allow_module_level=True)
 
+from perceval_interop.myqlm import myqlm_helper
+
 
 class _MockRPCHandler(RPCHandler):
 
-    def __init__(self, name):
+    def __init__(self, name, job_status: dict = None, running_polls: int = 0):
         super().__init__(name, "no_url", "no_token")
-        self._results = BSDistribution({FockState([1, 0]): 1})
+        self._job_status = job_status or {'status': 'completed'}
+        self._running_polls = running_polls  # Number of status requests answered with 'running' for each job
+        self._job_count = 0
+        self._status_polls = {}
+        self._running_jobs = set()
+        self.max_running_jobs = 0
 
     def create_job(self, payload) -> str:
-        return "0"
+        job_id = str(self._job_count)
+        self._job_count += 1
+        self._running_jobs.add(job_id)
+        self.max_running_jobs = max(self.max_running_jobs, len(self._running_jobs))
+        return job_id
 
     def get_job_status(self, id: str) -> dict:
-        return {'status': 'completed'}
+        self._status_polls[id] = self._status_polls.get(id, 0) + 1
+        if self._status_polls[id] <= self._running_polls:
+            return {'status': 'running', 'progress': 0.5}
+        return self._job_status
 
     def get_job_results(self, id: str) -> dict:
-        return {'results': json.dumps(serialize({"results": self._results}))}
+        self._running_jobs.discard(id)
+        return {'results': json.dumps(serialize(self.results(id)))}
 
     def fetch_platform_details(self) -> dict:
         return {"status": "available", "waiting_jobs": 0}
 
-    @property
-    def results(self):
-        return {"results": self._results}
+    @staticmethod
+    def results(job_id: str) -> dict:
+        # Each job has its own results, so that results can't be mixed up between jobs
+        return {"results": BSDistribution({FockState([int(job_id) + 1, 0]): 1})}
 
 
 class _MockRemoteProcessor(RemoteProcessor):
 
-    def __init__(self, name):
-        super().__init__(name, rpc_handler=_MockRPCHandler(name))
+    def __init__(self, name, job_status: dict = None, running_polls: int = 0):
+        super().__init__(name, rpc_handler=_MockRPCHandler(name, job_status, running_polls))
 
     def fetch_data(self):
         self._specs = {"name": self.name,
                        "noise": NoiseModel(0.8),  # Includes something not serializable by MyQML
                        "available_commands": ["probs"]}
 
-    def get_expected_results(self):
-        return self._rpc_handler.results
+    def get_expected_results(self, job_id: str = "0"):
+        return self._rpc_handler.results(job_id)
 
 
 def _test_serialize_deserialize(obj, file_name):
@@ -94,6 +112,18 @@ def _test_serialize_deserialize(obj, file_name):
     return obj
 
 
+def _make_experiment() -> Experiment:
+    exp = Experiment()
+    exp.add(0, Unitary(Matrix.random_unitary(4)))
+    exp.with_input(BasicState([1, 0, 1, 0]))
+    return exp
+
+
+def _make_jobs(n: int, **kwargs) -> list:
+    exp = _make_experiment()
+    return [MyQLMHelper.make_job("sample_count", exp, max_shots=1000, **kwargs) for _ in range(n)]
+
+
 def test_specs():
     rp = _MockRemoteProcessor("sim:test")
     handler = QuandelaQPUHandler(rp)
@@ -107,6 +137,28 @@ def test_specs():
     assert specs == rp.specs
 
 
+@pytest.mark.parametrize("decoder", ["orjson", "json"])
+def test_meta_data_round_trip(decoder, monkeypatch):
+    if decoder == "orjson":
+        pytest.importorskip("orjson")
+        monkeypatch.setattr(myqlm_helper, "_json_loads", myqlm_helper._orjson_loads)
+    else:
+        monkeypatch.setattr(myqlm_helper, "_json_loads", json.loads)
+
+    job = Job()
+    value = {1: "non-str key", "nan": math.nan, "inf": math.inf, "large_int": 2 ** 70, "state": BasicState([1, 0])}
+    MyQLMHelper.write_meta_data(job, MyQLMHelper.PAYLOAD_KEY, value)
+
+    job = _test_serialize_deserialize(job, "test_meta_data.job")
+
+    parsed = MyQLMHelper.parse_meta_data(job, MyQLMHelper.PAYLOAD_KEY)
+    assert parsed["1"] == "non-str key"  # JSON keys are always strings
+    assert math.isnan(parsed["nan"])
+    assert parsed["inf"] == math.inf
+    assert parsed["large_int"] == 2 ** 70
+    assert parsed["state"] == BasicState([1, 0])
+
+
 def test_user_stack():
     # Build your experiment
     exp = Experiment()
@@ -139,6 +191,97 @@ def test_user_stack():
     assert perceval_results == rp.get_expected_results()
 
 
+def test_make_job_with_perceval_objects():
+    exp = _make_experiment()
+
+    # Only the experiment is serialized by the payload generator, params and kwargs are kept as given
+    job = MyQLMHelper.make_job("sample_count", exp, params={"state": BasicState([0, 1, 0, 1])}, max_shots=1000,
+                               job_context={"state": BasicState([1, 0, 1, 0])})
+
+    full_payload = MyQLMHelper.parse_meta_data(job, MyQLMHelper.PAYLOAD_KEY)
+    assert full_payload["payload"]["job_context"]["state"] == BasicState([1, 0, 1, 0])
+
+
+def test_job_context():
+    job_context = {"my_context": [1, 2, 3]}
+    job = _make_jobs(1, job_context=job_context)[0]
+
+    rp = _MockRemoteProcessor("sim:test")
+    handler = QuandelaQPUHandler(rp)
+
+    perceval_results = MyQLMHelper.retrieve_results(handler.submit_job(job))
+
+    assert perceval_results["job_context"] == job_context
+    assert perceval_results["results"] == rp.get_expected_results()["results"]
+
+
+def test_failed_job():
+    job = _make_jobs(1, job_context={"my_context": 0})[0]
+
+    rp = _MockRemoteProcessor("sim:test", job_status={'status': 'error', 'failure_code': 'Mock failure'})
+    handler = QuandelaQPUHandler(rp)
+
+    perceval_results = MyQLMHelper.retrieve_results(handler.submit_job(job))
+
+    assert "error" in perceval_results
+    assert "results" not in perceval_results
+    assert perceval_results["job_context"] == {"my_context": 0}
+
+
+def test_cancelled_job_with_results():
+    job = _make_jobs(1)[0]
+
+    rp = _MockRemoteProcessor("sim:test", job_status={'status': 'canceled'})
+    handler = QuandelaQPUHandler(rp)
+
+    # The platform still serves the results obtained before the job was cancelled
+    perceval_results = MyQLMHelper.retrieve_results(handler.submit_job(job))
+
+    assert perceval_results == rp.get_expected_results()
+
+
+def test_batch():
+    jobs = _make_jobs(3)
+
+    rp = _MockRemoteProcessor("sim:test")
+    handler = QuandelaQPUHandler(rp)
+
+    results = handler.submit_batch(jobs)
+
+    # Results are expected in the same order as the jobs
+    assert len(results) == len(jobs)
+    for i, result in enumerate(results):
+        assert MyQLMHelper.retrieve_results(result) == rp.get_expected_results(str(i))
+
+
+def test_submit_async(monkeypatch):
+    # Every poll makes an actual status request, so that the mock counts them
+    monkeypatch.setattr(RemoteJob, "STATUS_REFRESH_DELAY", 0)
+    monkeypatch.setattr(QuandelaQPUHandler, "_REFRESH_DELAY", 0.01)
+
+    jobs = _make_jobs(3)
+
+    # Jobs stay running for a few status requests, so that they overlap on the platform
+    rp = _MockRemoteProcessor("sim:test", running_polls=3)
+    handler = QuandelaQPUHandler(rp, max_concurrent_jobs=2)
+
+    async def submit_all():
+        return await asyncio.gather(*(handler.submit_job_async(job) for job in jobs))
+
+    results = asyncio.run(submit_all())
+
+    # Jobs are created concurrently, so each one must get the results of exactly one job id
+    perceval_results = [MyQLMHelper.retrieve_results(result) for result in results]
+    for i in range(len(jobs)):
+        assert perceval_results.count(rp.get_expected_results(str(i))) == 1
+    assert rp.get_rpc_handler().max_running_jobs == 2
+    assert handler._get_progress() == 1.
+
+    # The same handler can be used again from another event loop
+    results = asyncio.run(submit_all())
+    assert len(results) == len(jobs)
+
+
 def test_session():
     mock_rp = _MockRemoteProcessor("sim:test")
     handler = QuandelaQPUHandler(mock_rp)